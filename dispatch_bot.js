@@ -1,38 +1,60 @@
 import 'dotenv/config';
 import TelegramBot from 'node-telegram-bot-api';
 import OpenAI from 'openai';
-import express from 'express';
-import fs from 'fs';
-import path from 'path';
-import { fileURLToPath } from 'url';
-import pdfParse from 'pdf-parse';
+import http from 'http';
+import os from 'os';
 import Tesseract from 'tesseract.js';
 import pdfjsLib from 'pdfjs-dist';
 import { createCanvas } from 'canvas';
+import {
+  CACHE_SWEEP_INTERVAL_MS,
+  addSemanticEntry,
+  cacheKey,
+  findSimilarResponse,
+  getCachedResponse,
+  setCachedResponse,
+  sweepExpiredCache,
+} from './dispatch_cache.js';
 
 const { getDocument } = pdfjsLib;
 
-const __filename = fileURLToPath(import.meta.url);
-const __dirname = path.dirname(__filename);
-
 const OPENAI_API_KEY = process.env.OPENAI_API_KEY;
 const TELEGRAM_BOT_TOKEN = process.env.TELEGRAM_BOT_TOKEN;
 
-// Initialize OpenAI client
-const openai = new OpenAI({ apiKey: OPENAI_API_KEY });
+// Initialize OpenAI client; the SDK already pools keep-alive connections
+// through agentkeepalive, so only the request timeout is tightened from its
+// 10-minute default
+const openai = new OpenAI({
+  apiKey: OPENAI_API_KEY,
+  timeout: 60 * 1000,
+});
 
 // Initialize Telegram Bot
 const bot = new TelegramBot(TELEGRAM_BOT_TOKEN, { polling: true });
 
-// Express app for health check
-const app = express();
-
-app.get('/', (req, res) => {
-  res.status(200).send('🤖 Dispatch Bot is running!');
-});
-
-app.get('/health', (req, res) => {
-  res.status(200).send('OK');
+// Health check server; the routes are constants, so plain node:http on the
+// bot's own event loop is all that's needed
+const HEALTH_ROUTES = {
+  '/': '🤖 Dispatch Bot is running!',
+  '/health': 'OK',
+};
+
+const server = http.createServer((req, res) => {
+  // Uptime monitors often probe with HEAD; answer it like GET, minus the body
+  const isHead = req.method === 'HEAD';
+  const body = req.method === 'GET' || isHead ? HEALTH_ROUTES[req.url.split('?')[0]] : undefined;
+  
+  if (body === undefined) {
+    res.writeHead(404, { 'Content-Type': 'text/plain; charset=utf-8' });
+    res.end(isHead ? undefined : 'Not Found');
+    return;
+  }
+  
+  res.writeHead(200, {
+    'Content-Type': 'text/plain; charset=utf-8',
+    'Content-Length': Buffer.byteLength(body),
+  });
+  res.end(isHead ? undefined : body);
 });
 
 // -------- START COMMAND ----------
@@ -53,25 +75,48 @@ Need help? Type /help`;
   await bot.sendMessage(chatId, welcomeMessage, { parse_mode: 'Markdown' });
 });
 
+// -------- OCR WORKER POOL ----------
+// Starting a Tesseract worker loads eng.traineddata, so a fixed pool is
+// started once and shared by every image and PDF page instead of paying
+// that cost per recognize() call. Each worker holds its own model copy,
+// hence the cap on small instances. availableParallelism() respects the
+// container's CPU limit, where os.cpus() reports every host core.
+const OCR_WORKER_COUNT = Math.max(
+  1,
+  Math.floor(Number(process.env.OCR_WORKERS) || Math.min(os.availableParallelism(), 4))
+);
+
+let ocrSchedulerPromise = null;
+
+function getOCRScheduler() {
+  if (!ocrSchedulerPromise) {
+    ocrSchedulerPromise = (async () => {
+      const scheduler = Tesseract.createScheduler();
+      const workers = await Promise.all(
+        Array.from({ length: OCR_WORKER_COUNT }, () => Tesseract.createWorker('eng'))
+      );
+      workers.forEach(worker => scheduler.addWorker(worker));
+      
+      console.log(`OCR scheduler started with ${OCR_WORKER_COUNT} workers`);
+      return scheduler;
+    })();
+    
+    // Let the next request retry if the workers failed to start
+    ocrSchedulerPromise.catch(() => {
+      ocrSchedulerPromise = null;
+    });
+  }
+  return ocrSchedulerPromise;
+}
+
 // -------- OCR FOR IMAGES ----------
-async function extractTextFromImage(imagePath) {
+async function extractTextFromImage(imageBuffer) {
   try {
     console.log(`=== STARTING OCR ===`);
-    console.log(`Image path: ${imagePath}`);
-    console.log(`File exists: ${fs.existsSync(imagePath)}`);
-    
-    if (fs.existsSync(imagePath)) {
-      const stats = fs.statSync(imagePath);
-      console.log(`File size: ${stats.size} bytes`);
-    }
+    console.log(`Image size: ${imageBuffer.length} bytes`);
     
-    const { data: { text } } = await Tesseract.recognize(imagePath, 'eng', {
-      logger: info => {
-        if (info.status === 'recognizing text') {
-          console.log(`OCR Progress: ${Math.round(info.progress * 100)}%`);
-        }
-      }
-    });
+    const scheduler = await getOCRScheduler();
+    const { data: { text } } = await scheduler.addJob('recognize', imageBuffer);
     
     console.log(`OCR completed. Text length: ${text.length}`);
     console.log('First 200 characters of OCR text:');
@@ -85,66 +130,140 @@ async function extractTextFromImage(imagePath) {
   }
 }
 
+// Separates pages in extracted PDF text so later steps can work per page
+const PAGE_BREAK = '\f';
+
+// -------- PDF LOADING ----------
+async function loadPDF(pdfBuffer) {
+  const data = new Uint8Array(pdfBuffer);
+  const loadingTask = getDocument({
+    data: data,
+    useSystemFonts: true,
+    standardFontDataUrl: 'node_modules/pdfjs-dist/standard_fonts/'
+  });
+  return loadingTask.promise;
+}
+
 // -------- PDF TEXT EXTRACTION ----------
-async function extractTextFromPDF(pdfPath) {
+// Pages with less embedded text than this are treated as scans and OCR'd
+const MIN_PAGE_TEXT_LENGTH = 50;
+
+async function extractTextFromPDF(pdfBuffer) {
+  let pdf = null;
+  
   try {
     console.log('=== PDF TEXT EXTRACTION ===');
-    console.log('PDF path:', pdfPath);
-    console.log('File exists:', fs.existsSync(pdfPath));
+    console.log('File size:', pdfBuffer.length, 'bytes');
     
-    if (fs.existsSync(pdfPath)) {
-      const stats = fs.statSync(pdfPath);
-      console.log('File size:', stats.size, 'bytes');
-    }
+    // Parse the document once with PDF.js; the OCR fallback reuses it
+    pdf = await loadPDF(pdfBuffer);
     
     console.log('Attempting to extract text from PDF...');
-    const dataBuffer = fs.readFileSync(pdfPath);
-    const data = await pdfParse(dataBuffer);
-    const text = data.text.trim();
+    const pageTexts = [];
+    
+    for (let pageNum = 1; pageNum <= pdf.numPages; pageNum++) {
+      try {
+        const page = await pdf.getPage(pageNum);
+        const content = await page.getTextContent();
+        pageTexts.push(content.items.map(item => item.str + (item.hasEOL ? '\n' : '')).join(''));
+      } catch (err) {
+        console.error(`Text extraction error on page ${pageNum}:`, err);
+        pageTexts.push('');
+      }
+    }
+    
+    // Mixed PDFs (scanned cover + typed body) are common, so only the pages
+    // without usable embedded text go through OCR
+    const scannedPages = [];
+    pageTexts.forEach((pageText, index) => {
+      if (pageText.trim().length < MIN_PAGE_TEXT_LENGTH) {
+        scannedPages.push(index + 1);
+      }
+    });
+    
+    if (scannedPages.length > 0) {
+      console.log(`⚠️ Minimal text on page(s) ${scannedPages.join(', ')}. Using OCR...`);
+      const ocrTexts = await extractTextFromPDFPagesWithOCR(pdf, scannedPages);
+      // Keep whichever is longer, so a short typed page survives a failed OCR
+      scannedPages.forEach((pageNum, index) => {
+        if (ocrTexts[index].trim().length > pageTexts[pageNum - 1].trim().length) {
+          pageTexts[pageNum - 1] = ocrTexts[index];
+        }
+      });
+    }
+    
+    const text = pageTexts.join(PAGE_BREAK).trim();
     
     console.log(`Extracted text length: ${text.length}`);
     console.log('First 300 characters:');
     console.log(text.substring(0, 300));
     
-    // If very little text was extracted, it's likely an image-based PDF
-    if (text.length < 100) {
-      console.log('⚠️ Minimal text detected (<100 chars). Using OCR...');
-      return await extractTextFromPDFWithOCR(pdfPath);
-    }
-    
     console.log('✓ Text extraction successful');
     console.log('===========================');
     return text;
   } catch (error) {
     console.error('PDF Parse Error:', error);
+    
+    // Nothing to render if the document itself could not be opened
+    if (!pdf) {
+      return '';
+    }
+    
     console.log('Falling back to OCR...');
-    return await extractTextFromPDFWithOCR(pdfPath);
+    const allPages = Array.from({ length: pdf.numPages }, (_, index) => index + 1);
+    return (await extractTextFromPDFPagesWithOCR(pdf, allPages)).join(PAGE_BREAK).trim();
+  } finally {
+    if (pdf) {
+      await pdf.destroy();
+    }
   }
 }
 
 // -------- PDF OCR EXTRACTION ----------
-async function extractTextFromPDFWithOCR(pdfPath) {
+// node-canvas encodes on the libuv thread pool when given a callback, so the
+// PNG encode of each page stays off the event loop. PDF.js parsing,
+// getTextContent() and page.render() still run on the main thread (its fake
+// worker in Node), so large PDFs can still delay other chats.
+function canvasToBuffer(canvas, mimeType, config) {
+  return new Promise((resolve, reject) => {
+    canvas.toBuffer((err, buffer) => (err ? reject(err) : resolve(buffer)), mimeType, config);
+  });
+}
+
+// Tesseract time grows with pixel count, so oversized pages are scaled down
+// toward OCR_TARGET_LONG_EDGE_PX on their long edge. The zoom never exceeds
+// the previous fixed 2x, so Letter/A4 pages render exactly as before.
+const OCR_TARGET_LONG_EDGE_PX = 2200;
+
+function ocrScaleForPage(page) {
+  const { width, height } = page.getViewport({ scale: 1.0 });
+  return Math.max(1.0, Math.min(2.0, OCR_TARGET_LONG_EDGE_PX / Math.max(width, height)));
+}
+
+// Returns the OCR text of each requested page, in the order given
+async function extractTextFromPDFPagesWithOCR(pdf, pageNumbers) {
   try {
     console.log('Converting PDF pages to images using PDF.js...');
     
-    // Read PDF file
-    const data = new Uint8Array(fs.readFileSync(pdfPath));
-    const loadingTask = getDocument({
-      data: data,
-      useSystemFonts: true,
-      standardFontDataUrl: 'node_modules/pdfjs-dist/standard_fonts/'
-    });
-    const pdf = await loadingTask.promise;
-    
-    console.log(`PDF has ${pdf.numPages} pages`);
+    console.log(`OCR on ${pageNumbers.length} of ${pdf.numPages} pages`);
     
-    let fullText = '';
+    // Pages are independent, so they are OCR'd in parallel on the shared
+    // worker pool (each worker runs in its own thread)
+    const scheduler = await getOCRScheduler();
+    const pageJobs = [];
+    let oldestPendingJob = 0;
     
-    // Process each page
-    for (let pageNum = 1; pageNum <= pdf.numPages; pageNum++) {
+    // Render each page and queue it for OCR straight from memory
+    for (const pageNum of pageNumbers) {
+      // Don't render further ahead than the workers can take, otherwise every
+      // page image of a long scan sits in memory at once
+      while (pageJobs.length - oldestPendingJob >= OCR_WORKER_COUNT) {
+        await pageJobs[oldestPendingJob++];
+      }
+      
       try {
         const page = await pdf.getPage(pageNum);
-        const viewport = page.getViewport({ scale: 2.0 });
+        const viewport = page.getViewport({ scale: ocrScaleForPage(page) });
         
         // Create canvas
         const canvas = createCanvas(viewport.width, viewport.height);
@@ -156,45 +275,86 @@ async function extractTextFromPDFWithOCR(pdfPath) {
           viewport: viewport
         }).promise;
         
-        // Convert canvas to image buffer
-        const imageBuffer = canvas.toBuffer('image/png');
-        
-        // Save temporarily for OCR
-        const tempImagePath = path.join(__dirname, `temp_page_${pageNum}.png`);
-        fs.writeFileSync(tempImagePath, imageBuffer);
-        
-        console.log(`Processing page ${pageNum} with OCR: ${tempImagePath}`);
+        // Convert canvas to PNG with the fastest deflate level; raw pixels
+        // would be ~15 MB per page, copied again into the worker thread
+        const imageBuffer = await canvasToBuffer(canvas, 'image/png', {
+          compressionLevel: 1
+        });
         
-        // Extract text using OCR
-        const pageText = await extractTextFromImage(tempImagePath);
-        fullText += `\n--- Page ${pageNum} ---\n${pageText}\n`;
+        console.log(`Processing page ${pageNum} with OCR`);
         
-        // Clean up temp image
-        if (fs.existsSync(tempImagePath)) {
-          fs.unlinkSync(tempImagePath);
-        }
+        pageJobs.push(
+          scheduler.addJob('recognize', imageBuffer)
+            .then(({ data: { text } }) => text.trim())
+            .catch(err => {
+              console.error(`Error processing page ${pageNum}:`, err);
+              return '';
+            })
+        );
       } catch (err) {
         console.error(`Error processing page ${pageNum}:`, err);
+        pageJobs.push('');
       }
     }
     
-    console.log(`Total OCR text length: ${fullText.length}`);
-    return fullText;
+    const pageTexts = await Promise.all(pageJobs);
+    
+    console.log(`Total OCR text length: ${pageTexts.reduce((sum, text) => sum + text.length, 0)}`);
+    return pageTexts;
   } catch (error) {
     console.error('OCR PDF Error:', error);
-    return '';
+    return pageNumbers.map(() => '');
   }
 }
 
-// -------- OPENAI DISPATCH EXTRACTION ----------
-async function extractDispatchInfoWithAI(text) {
-  console.log('=== SENDING TO AI ===');
-  console.log('Text length:', text.length);
-  console.log('First 500 characters of text:');
-  console.log(text.substring(0, 500));
-  console.log('=====================');
+// -------- TEXT PREFILTER ----------
+// Rate cons carry pages of legal boilerplate that cost tokens without
+// contributing fields, so only pages that mention load details are sent.
+const RELEVANT_PAGE_PATTERN = /\b(load|ref|pu|del|pick\s?up|deliver(y|ies)?|stops?|drop(\s?off)?s?|appt|appointments?|rate|miles?|shippers?|consignees?|receivers?|receiving|bol)\b/i;
+// Caps apply per page, so one long page can't push later stop or delivery
+// pages out of the prompt; the overall cap is only a safety net
+const MAX_AI_PAGE_LENGTH = 4000;
+const MAX_AI_TEXT_LENGTH = 30000;
+
+function collapseWhitespace(text) {
+  return text
+    .replace(/[ \t\r\v]+/g, ' ')
+    .replace(/ ?\n ?/g, '\n')
+    .replace(/\n{3,}/g, '\n\n')
+    .trim();
+}
+
+function shrinkDispatchText(text) {
+  const pages = text
+    .split(PAGE_BREAK)
+    .filter(page => page.trim());
+  const relevantPages = pages.filter(page => RELEVANT_PAGE_PATTERN.test(page));
   
-  const prompt = `You are an expert logistics dispatcher bot.
+  const keptPages = (relevantPages.length > 0 ? relevantPages : pages).map((page, index) => {
+    const collapsed = collapseWhitespace(page);
+    if (collapsed.length > MAX_AI_PAGE_LENGTH) {
+      console.log(`⚠️ Truncating kept page ${index + 1} from ${collapsed.length} to ${MAX_AI_PAGE_LENGTH} chars`);
+      return collapsed.substring(0, MAX_AI_PAGE_LENGTH);
+    }
+    return collapsed;
+  });
+  
+  const shrunk = keptPages.join('\n\n');
+  if (shrunk.length > MAX_AI_TEXT_LENGTH) {
+    console.log(`⚠️ Truncating AI text from ${shrunk.length} to ${MAX_AI_TEXT_LENGTH} chars`);
+    return shrunk.substring(0, MAX_AI_TEXT_LENGTH);
+  }
+  return shrunk;
+}
+
+// -------- OPENAI DISPATCH EXTRACTION ----------
+// Everything static lives in the system message so every request shares the
+// same prefix and OpenAI can serve it from the prompt cache. Keep these
+// constants free of interpolation (names, dates, file names); anything that
+// varies per request belongs after RATE_CONFIRMATION_HEADER.
+const PROMPT_CACHE_KEY = 'dispatch-v1';
+
+const ROLE = `You are an expert logistics dispatcher bot.
 
 Read the rate confirmation text below and extract the following fields:
 - Load #
@@ -204,10 +364,9 @@ Read the rate confirmation text below and extract the following fields:
 - Rate
 - Miles
 - Fines or Notes
-- Any other important details or numbers found in the text.
-
+- Any other important details or numbers found in the text.`;
 
-Return the answer in this exact format (if there is any additional info, include it):
+const FORMAT_SPEC = `Return the answer in this exact format (if there is any additional info, include it):
 
 Load# [number]
 
@@ -235,32 +394,217 @@ Mile: [miles] miles
 📝BOL/POD/Freight/Seal pictures MUST send otherwise $250 fine❗️
 🚨 No update / $250 fine❗️
 
-Your communication is really going smoothly❗️
+Your communication is really going smoothly❗️`;
 
-If any field is missing, write "Not found" but **keep the format identical**.
+const RULES = `If any field is missing, write "Not found" but **keep the format identical**.`;
 
----
-RATE CONFIRMATION TEXT:
-${text}`;
+const SYSTEM_PROMPT = [ROLE, FORMAT_SPEC, RULES].join('\n\n');
 
+const RATE_CONFIRMATION_HEADER = '---\nRATE CONFIRMATION TEXT:\n';
+
+// Built once at module load and shared by every request, so the cacheable
+// prefix is the same frozen object each time and can't pick up request data
+const SYSTEM_MESSAGE = Object.freeze({ role: 'system', content: SYSTEM_PROMPT });
+
+function buildPromptMessages(text) {
+  return [SYSTEM_MESSAGE, { role: 'user', content: RATE_CONFIRMATION_HEADER + text }];
+}
+
+// Numbers, dates and times in an answer ("LD4512", "1,500", "10/14",
+// "08:00"): any word containing a digit, joined by . , : or /
+const FACT_TOKEN_PATTERN = /[A-Za-z0-9]*\d[A-Za-z0-9]*(?:[.,:/][A-Za-z0-9]*\d[A-Za-z0-9]*)*/g;
+
+// Figures that the answer template copies verbatim: only the fine warning
+// lines ($250). Placeholders like "[address line 1]" must not count, or a
+// cached "1" or "2" in an address or stop number would go unchecked.
+const TEMPLATE_FACT_TOKENS = new Set(
+  FORMAT_SPEC.split('\n')
+    .filter(line => /\bfine\b/.test(line))
+    .join('\n')
+    .match(FACT_TOKEN_PATTERN)
+);
+
+// A semantic hit is only trusted if every number, date and time in the
+// cached answer also appears as a whole word in the new text. A revised rate
+// con for the same load embeds almost identically, so the Load# alone would
+// happily serve the old rate or appointment times.
+function cachedFactsMatch(cachedResult, text) {
+  const facts = (cachedResult.match(FACT_TOKEN_PATTERN) || [])
+    .filter(token => !TEMPLATE_FACT_TOKENS.has(token));
+  
+  return facts.length > 0 && facts.every(token => {
+    const escaped = token.replace(/[.*+?^${}()|[\]\\/]/g, '\\$&');
+    return new RegExp(`(?<![A-Za-z0-9])${escaped}(?![A-Za-z0-9])`).test(text);
+  });
+}
+
+// Extractions currently running, keyed like the response cache. When a
+// broker blasts the same rate con to several drivers at once, every upload
+// awaits the one in-flight call instead of starting its own. An entry stays
+// until its cache write lands, so an identical upload can't slip in between
+// and miss both.
+const inflightExtractions = new Map();
+
+async function extractDispatchInfoWithAI(rawText, onProgress) {
+  const text = shrinkDispatchText(rawText);
+  
+  console.log('=== SENDING TO AI ===');
+  console.log('Text length:', rawText.length, '→', text.length);
+  console.log('First 500 characters of text:');
+  console.log(text.substring(0, 500));
+  console.log('=====================');
+  
+  const key = cacheKey(text);
+  
+  if (inflightExtractions.has(key)) {
+    console.log(`✓ Joining in-flight extraction (${key.substring(0, 12)})`);
+    return inflightExtractions.get(key);
+  }
+  
+  const extraction = runDispatchExtraction(text, key, onProgress);
+  const sharedResult = extraction.then(({ result }) => result);
+  // Failures are reported through the first caller; joiners still see them
+  sharedResult.catch(() => {});
+  inflightExtractions.set(key, sharedResult);
+  
+  try {
+    const { result, cacheWrite } = await extraction;
+    cacheWrite.finally(() => inflightExtractions.delete(key));
+    return result;
+  } catch (error) {
+    inflightExtractions.delete(key);
+    throw error;
+  }
+}
+
+// Resolves to { result, cacheWrite }; cacheWrite is the pending (never
+// rejecting) response cache write, which the reply doesn't wait on
+async function runDispatchExtraction(text, key, onProgress) {
+  const cached = await getCachedResponse(key);
+  if (cached) {
+    console.log(`✓ Cache hit (${key.substring(0, 12)}), skipping OpenAI call`);
+    return { result: cached, cacheWrite: Promise.resolve() };
+  }
+  
+  let embedding = null;
+  try {
+    const embeddingResponse = await openai.embeddings.create({
+      model: 'text-embedding-3-small',
+      input: text.substring(0, 8000),
+    });
+    embedding = embeddingResponse.data[0].embedding;
+    
+    const similar = await findSimilarResponse(embedding);
+    if (similar && cachedFactsMatch(similar.response, text)) {
+      console.log(`✓ Semantic cache hit (score ${similar.score.toFixed(3)}), skipping OpenAI call`);
+      return { result: similar.response, cacheWrite: setCachedResponse(key, similar.response) };
+    }
+  } catch (error) {
+    console.error('Embedding Error:', error);
+  }
+  
   console.log('Calling OpenAI API...');
   
-  const response = await openai.chat.completions.create({
+  const stream = await openai.chat.completions.create({
     model: 'gpt-4o-mini',
-    messages: [
-      { role: 'system', content: 'You are an expert logistics dispatcher assistant.' },
-      { role: 'user', content: prompt }
-    ],
+    messages: buildPromptMessages(text),
     temperature: 0.2,
+    prompt_cache_key: PROMPT_CACHE_KEY,
+    stream: true,
   });
 
-  const result = response.choices[0].message.content.trim();
+  // Stream the answer so the first lines (Load#, REF#) reach the user
+  // while the rest is still being generated
+  let streamedText = '';
+  for await (const chunk of stream) {
+    streamedText += chunk.choices[0]?.delta?.content || '';
+    if (onProgress) {
+      onProgress(streamedText);
+    }
+  }
+
+  const result = streamedText.trim();
+  
+  if (!result) {
+    throw new Error('AI returned an empty response');
+  }
   
   console.log('=== AI RESPONSE ===');
   console.log(result);
   console.log('===================');
 
-  return result;
+  // Cache writes log their own errors, so the reply doesn't wait on disk
+  if (embedding) {
+    addSemanticEntry(embedding, result);
+  }
+
+  return { result, cacheWrite: setCachedResponse(key, result) };
+}
+
+// -------- STREAMING REPLIES ----------
+// Telegram rate-limits edits, so partial output is pushed at most once per
+// interval and never while the previous edit is still in flight.
+const STREAM_EDIT_INTERVAL_MS = 1000;
+
+function createStreamingEditor(chatId, messageId) {
+  let lastText = '';
+  let lastEditAt = 0;
+  let pendingEdit = null;
+
+  const edit = async (text) => {
+    if (text === lastText) {
+      return true;
+    }
+    if (!text.trim()) {
+      return false;
+    }
+
+    lastEditAt = Date.now();
+
+    try {
+      await bot.editMessageText(text, { chat_id: chatId, message_id: messageId });
+      lastText = text;
+      return true;
+    } catch (error) {
+      console.error('Edit message error:', error.message);
+      return false;
+    }
+  };
+
+  return {
+    update(text) {
+      if (pendingEdit || Date.now() - lastEditAt < STREAM_EDIT_INTERVAL_MS) {
+        return;
+      }
+      pendingEdit = edit(text).finally(() => {
+        pendingEdit = null;
+      });
+    },
+
+    async finish(text) {
+      if (pendingEdit) {
+        await pendingEdit;
+      }
+      // Fall back to a fresh message if the status message can't be edited
+      if (!(await edit(text))) {
+        await bot.sendMessage(chatId, text);
+      }
+    },
+  };
+}
+
+// -------- TELEGRAM FILE DOWNLOAD ----------
+// Files are kept in memory: PDF.js and Tesseract both take buffers, and
+// nothing on disk means two users uploading "rate.pdf" can't collide.
+async function downloadTelegramFile(file) {
+  const fileUrl = `https://api.telegram.org/file/bot${TELEGRAM_BOT_TOKEN}/${file.file_path}`;
+  const response = await fetch(fileUrl);
+  
+  if (!response.ok) {
+    throw new Error(`Download failed with status ${response.status}`);
+  }
+  
+  return Buffer.from(await response.arrayBuffer());
 }
 
 // -------- TELEGRAM HANDLERS ----------
@@ -274,55 +618,46 @@ bot.on('document', async (msg) => {
   }
   
   const fileId = document.file_id;
-  const fileName = document.file_name || `temp_${fileId}.pdf`;
-  const filePath = path.join(__dirname, fileName);
+  
+  // Drives the status message. Errors are written into it too, so neither
+  // the wait notice nor a half-streamed answer that looks valid stays up
+  let editor = null;
   
   try {
-    await bot.sendMessage(chatId, '📄 PDF received. Extracting info... Please wait ⏳');
-    
-    // Download the file
-    const file = await bot.getFile(fileId);
-    const fileUrl = `https://api.telegram.org/file/bot${TELEGRAM_BOT_TOKEN}/${file.file_path}`;
-    
-    console.log(`Downloading file: ${fileUrl}`);
-    
-    // Download file
-    const https = await import('https');
-    const fileStream = fs.createWriteStream(filePath);
-    
-    await new Promise((resolve, reject) => {
-      https.get(fileUrl, (response) => {
-        response.pipe(fileStream);
-        fileStream.on('finish', () => {
-          fileStream.close();
-          resolve();
-        });
-      }).on('error', reject);
-    });
+    // Acknowledge and resolve the download URL concurrently; neither call
+    // depends on the other, so there is no reason to pay two round trips
+    const [statusMessage, file] = await Promise.all([
+      bot.sendMessage(chatId, '📄 PDF received. Extracting info... Please wait ⏳'),
+      bot.getFile(fileId),
+    ]);
+    editor = createStreamingEditor(chatId, statusMessage.message_id);
+    
+    // Download the file straight into memory
+    console.log(`Downloading file: ${file.file_path}`);
+    const pdfBuffer = await downloadTelegramFile(file);
     
     console.log('File downloaded successfully');
     
     // Extract text
-    const text = await extractTextFromPDF(filePath);
+    const text = await extractTextFromPDF(pdfBuffer);
     
     if (!text || text.length < 50) {
-      await bot.sendMessage(chatId, '⚠️ Could not extract text from PDF. Please ensure the file is readable.');
+      await editor.finish('⚠️ Could not extract text from PDF. Please ensure the file is readable.');
       return;
     }
     
     console.log('Text extracted, sending to AI...');
     
-    // Process with AI
-    const result = await extractDispatchInfoWithAI(text);
-    await bot.sendMessage(chatId, result);
+    // Process with AI, streaming partial output into the status message
+    const result = await extractDispatchInfoWithAI(text, editor.update);
+    await editor.finish(result);
     
   } catch (error) {
     console.error('Error:', error);
-    await bot.sendMessage(chatId, `⚠️ Error: ${error.message}`);
-  } finally {
-    // Clean up
-    if (fs.existsSync(filePath)) {
-      fs.unlinkSync(filePath);
+    if (editor) {
+      await editor.finish(`⚠️ Error: ${error.message}`);
+    } else {
+      await bot.sendMessage(chatId, `⚠️ Error: ${error.message}`);
     }
   }
 });
@@ -331,67 +666,62 @@ bot.on('photo', async (msg) => {
   const chatId = msg.chat.id;
   const photo = msg.photo[msg.photo.length - 1]; // Get highest resolution
   const fileId = photo.file_id;
-  const filePath = path.join(__dirname, `temp_${fileId}.jpg`);
+  
+  // Drives the status message. Errors are written into it too, so neither
+  // the wait notice nor a half-streamed answer that looks valid stays up
+  let editor = null;
   
   try {
-    await bot.sendMessage(chatId, '📷 Image received. Extracting text with OCR... Please wait ⏳');
-    
-    // Download the file
-    const file = await bot.getFile(fileId);
-    const fileUrl = `https://api.telegram.org/file/bot${TELEGRAM_BOT_TOKEN}/${file.file_path}`;
-    
-    console.log(`Downloading image: ${fileUrl}`);
-    
-    // Download file
-    const https = await import('https');
-    const fileStream = fs.createWriteStream(filePath);
-    
-    await new Promise((resolve, reject) => {
-      https.get(fileUrl, (response) => {
-        response.pipe(fileStream);
-        fileStream.on('finish', () => {
-          fileStream.close();
-          resolve();
-        });
-      }).on('error', reject);
-    });
+    // Acknowledge and resolve the download URL concurrently; neither call
+    // depends on the other, so there is no reason to pay two round trips
+    const [statusMessage, file] = await Promise.all([
+      bot.sendMessage(chatId, '📷 Image received. Extracting text with OCR... Please wait ⏳'),
+      bot.getFile(fileId),
+    ]);
+    editor = createStreamingEditor(chatId, statusMessage.message_id);
+    
+    // Download the file straight into memory
+    console.log(`Downloading image: ${file.file_path}`);
+    const imageBuffer = await downloadTelegramFile(file);
     
     console.log('Image downloaded, starting OCR...');
     
     // Extract text using OCR
-    const text = await extractTextFromImage(filePath);
+    const text = await extractTextFromImage(imageBuffer);
     
     if (!text || text.length < 50) {
-      await bot.sendMessage(chatId, '⚠️ Could not extract text from image. Please ensure the image is clear and readable.');
+      await editor.finish('⚠️ Could not extract text from image. Please ensure the image is clear and readable.');
       return;
     }
     
     console.log('OCR completed, sending to AI...');
     
-    // Process with AI
-    const result = await extractDispatchInfoWithAI(text);
-    await bot.sendMessage(chatId, result);
+    // Process with AI, streaming partial output into the status message
+    const result = await extractDispatchInfoWithAI(text, editor.update);
+    await editor.finish(result);
     
   } catch (error) {
     console.error('Error processing image:', error);
-    await bot.sendMessage(chatId, `⚠️ Error processing image: ${error.message}`);
-  } finally {
-    // Clean up
-    if (fs.existsSync(filePath)) {
-      fs.unlinkSync(filePath);
+    if (editor) {
+      await editor.finish(`⚠️ Error processing image: ${error.message}`);
+    } else {
+      await bot.sendMessage(chatId, `⚠️ Error processing image: ${error.message}`);
     }
   }
 });
 
-// Create temp directory if it doesn't exist
-if (!fs.existsSync('./temp')) {
-  fs.mkdirSync('./temp');
-}
-
 // -------- START SERVER ----------
 const PORT = process.env.PORT || 10000;
 
-app.listen(PORT, '0.0.0.0', () => {
+server.listen(PORT, '0.0.0.0', () => {
   console.log(`🌐 Server started on port ${PORT}`);
   console.log('🤖 Bot is running... Send /start or a PDF in Telegram.');
-});
\ No newline at end of file
+});
+
+// Warm up the OCR workers so the first scanned upload doesn't pay for it
+getOCRScheduler().catch(error => console.error('OCR startup error:', error));
+
+// Clear out expired response cache entries now and then every hour
+const runCacheSweep = () => sweepExpiredCache().catch(error => console.error('Cache sweep error:', error));
+runCacheSweep();
+setInterval(runCacheSweep, CACHE_SWEEP_INTERVAL_MS);
\ No newline at end of file
@@ -0,0 +1,219 @@
+import crypto from 'crypto';
+import fs from 'fs/promises';
+import os from 'os';
+import path from 'path';
+
+// Bump whenever the prompt changes so stale answers are never served.
+export const PROMPT_VERSION = 'v2';
+
+const CACHE_DIR = path.join(os.tmpdir(), 'dispatch_cache');
+const CACHE_TTL_MS = 7 * 24 * 60 * 60 * 1000;
+
+// -------- RESPONSE CACHE ----------
+export function cacheKey(text) {
+  return crypto.createHash('sha256').update(`${PROMPT_VERSION}|${text}`).digest('hex');
+}
+
+function entryPath(key) {
+  return path.join(CACHE_DIR, `${key}.json`);
+}
+
+export async function getCachedResponse(key) {
+  try {
+    const entry = JSON.parse(await fs.readFile(entryPath(key), 'utf8'));
+
+    if (entry.promptVersion !== PROMPT_VERSION || entry.expiresAt < Date.now()) {
+      await fs.rm(entryPath(key), { force: true });
+      return null;
+    }
+
+    return entry.response;
+  } catch (error) {
+    if (error.code !== 'ENOENT') {
+      console.error('Cache read error:', error);
+    }
+    return null;
+  }
+}
+
+export async function setCachedResponse(key, response) {
+  const createdAt = Date.now();
+  const entry = {
+    inputHash: key,
+    promptVersion: PROMPT_VERSION,
+    response,
+    createdAt,
+    expiresAt: createdAt + CACHE_TTL_MS,
+  };
+
+  // Write to a unique temp file and rename it into place, so readers and the
+  // sweep never see a half-written entry
+  const tempPath = `${entryPath(key)}.${crypto.randomUUID()}.tmp`;
+
+  try {
+    await fs.mkdir(CACHE_DIR, { recursive: true });
+    await fs.writeFile(tempPath, JSON.stringify(entry));
+    await fs.rename(tempPath, entryPath(key));
+  } catch (error) {
+    console.error('Cache write error:', error);
+    await fs.rm(tempPath, { force: true }).catch(() => {});
+  }
+}
+
+// Entries are otherwise only dropped when their own key is read again, so
+// expired ones are swept on startup and periodically.
+export const CACHE_SWEEP_INTERVAL_MS = 60 * 60 * 1000;
+
+export async function sweepExpiredCache() {
+  let fileNames;
+  try {
+    fileNames = await fs.readdir(CACHE_DIR);
+  } catch (error) {
+    if (error.code !== 'ENOENT') {
+      console.error('Cache sweep error:', error);
+    }
+    return;
+  }
+
+  const now = Date.now();
+  let removed = 0;
+
+  for (const fileName of fileNames.filter(name => name.endsWith('.json'))) {
+    const filePath = path.join(CACHE_DIR, fileName);
+    let entry = null;
+
+    try {
+      entry = JSON.parse(await fs.readFile(filePath, 'utf8'));
+    } catch (error) {
+      if (error.code === 'ENOENT') {
+        continue;
+      }
+      // Unreadable or truncated entries are dropped like expired ones
+    }
+
+    if (!entry || entry.promptVersion !== PROMPT_VERSION || entry.expiresAt < now) {
+      try {
+        await fs.rm(filePath, { force: true });
+        removed++;
+      } catch (error) {
+        console.error('Cache sweep error:', error);
+      }
+    }
+  }
+
+  if (removed > 0) {
+    console.log(`Cache sweep removed ${removed} expired entries`);
+  }
+}
+
+// -------- SEMANTIC CACHE ----------
+// Near-duplicate rate cons (re-OCR noise, whitespace) miss the hash cache,
+// so we also keep normalized embeddings and match by cosine similarity.
+export const SEMANTIC_SIMILARITY_THRESHOLD = 0.95;
+
+const SEMANTIC_INDEX_PATH = path.join(CACHE_DIR, 'semantic.jsonl');
+
+// Each entry carries a ~1536-float embedding, so only the newest are kept
+const MAX_SEMANTIC_ENTRIES = 1000;
+
+let semanticEntriesPromise = null;
+
+function normalize(vector) {
+  const norm = Math.sqrt(vector.reduce((sum, value) => sum + value * value, 0)) || 1;
+  return vector.map(value => value / norm);
+}
+
+function parseSemanticLine(line) {
+  try {
+    return JSON.parse(line);
+  } catch {
+    // A crash mid-append leaves a truncated last line; skip just that one
+    return null;
+  }
+}
+
+async function loadSemanticEntries() {
+  let lines;
+  try {
+    lines = (await fs.readFile(SEMANTIC_INDEX_PATH, 'utf8')).split('\n').filter(Boolean);
+  } catch (error) {
+    if (error.code !== 'ENOENT') {
+      console.error('Semantic cache load error:', error);
+    }
+    return [];
+  }
+
+  const now = Date.now();
+  const entries = lines
+    .map(parseSemanticLine)
+    .filter(entry => entry && entry.promptVersion === PROMPT_VERSION && entry.expiresAt >= now)
+    .slice(-MAX_SEMANTIC_ENTRIES);
+
+  // Compact the index so bad, expired and overflow lines don't pile up
+  if (entries.length !== lines.length) {
+    try {
+      const tempPath = `${SEMANTIC_INDEX_PATH}.tmp`;
+      await fs.writeFile(tempPath, entries.map(entry => `${JSON.stringify(entry)}\n`).join(''));
+      await fs.rename(tempPath, SEMANTIC_INDEX_PATH);
+      console.log(`Semantic cache compacted: ${lines.length} → ${entries.length} entries`);
+    } catch (error) {
+      console.error('Semantic cache compaction error:', error);
+    }
+  }
+
+  return entries;
+}
+
+function getSemanticEntries() {
+  if (!semanticEntriesPromise) {
+    semanticEntriesPromise = loadSemanticEntries();
+  }
+  return semanticEntriesPromise;
+}
+
+export async function findSimilarResponse(embedding) {
+  const query = normalize(embedding);
+  const now = Date.now();
+  let best = null;
+
+  for (const entry of await getSemanticEntries()) {
+    if (entry.expiresAt < now) {
+      continue;
+    }
+
+    let score = 0;
+    for (let i = 0; i < query.length; i++) {
+      score += query[i] * entry.embedding[i];
+    }
+
+    if (!best || score > best.score) {
+      best = { response: entry.response, score };
+    }
+  }
+
+  return best && best.score >= SEMANTIC_SIMILARITY_THRESHOLD ? best : null;
+}
+
+export async function addSemanticEntry(embedding, response) {
+  const createdAt = Date.now();
+  const entry = {
+    promptVersion: PROMPT_VERSION,
+    embedding: normalize(embedding),
+    response,
+    createdAt,
+    expiresAt: createdAt + CACHE_TTL_MS,
+  };
+
+  const entries = await getSemanticEntries();
+  entries.push(entry);
+  if (entries.length > MAX_SEMANTIC_ENTRIES) {
+    entries.splice(0, entries.length - MAX_SEMANTIC_ENTRIES);
+  }
+
+  try {
+    await fs.mkdir(CACHE_DIR, { recursive: true });
+    await fs.appendFile(SEMANTIC_INDEX_PATH, `${JSON.stringify(entry)}\n`);
+  } catch (error) {
+    console.error('Semantic cache write error:', error);
+  }
+}